@@ -0,0 +1,145 @@
+from pura.compound import CompoundIdentifier, CompoundIdentifierType
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import json
+import sqlite3
+
+CacheKey = Tuple[str, str, str, str]
+
+
+class ResolverCache:
+    """Cache of identifiers resolved by services.
+
+    Results are kept in an in-memory least recently used (LRU) cache and,
+    optionally, in a SQLite database so they persist across runs.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        The maximum number of results kept in memory. Default is 100,000.
+    path : str, optional
+        Path to a SQLite database used to persist results. If None (the default),
+        results are only cached in memory.
+    commit_interval : int, optional
+        The number of results written to the database before they are committed.
+        Pending results are also committed by :meth:`flush` and :meth:`close`.
+        Default is 1,000.
+
+    Examples
+    --------
+
+    >>> cache = ResolverCache(path="pura_cache.db")
+    >>> resolver = CompoundResolver(services=[PubChem()], cache=cache)
+
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 100_000,
+        path: Optional[str] = None,
+        commit_interval: int = 1_000,
+    ) -> None:
+        self.maxsize = maxsize
+        self.path = path
+        self.commit_interval = commit_interval
+        self._memory = OrderedDict()
+        self._connection = None
+        self._n_uncommitted = 0
+        if path is not None:
+            self._connection = sqlite3.connect(path)
+            with self._connection:
+                self._connection.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS resolved (
+                        service TEXT NOT NULL,
+                        identifier_type TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        output_identifier_types TEXT NOT NULL,
+                        identifiers TEXT NOT NULL,
+                        PRIMARY KEY (service, identifier_type, value, output_identifier_types)
+                    )
+                    """
+                )
+
+    @staticmethod
+    def make_key(
+        service_key: str,
+        input_identifier: CompoundIdentifier,
+        output_identifier_types: List[CompoundIdentifierType],
+    ) -> CacheKey:
+        """Make the key under which the results of a request are cached"""
+        return (
+            service_key,
+            input_identifier.identifier_type.value,
+            input_identifier.value,
+            ",".join(
+                output_identifier_type.value
+                for output_identifier_type in output_identifier_types
+            ),
+        )
+
+    def get(self, key: CacheKey) -> Optional[List[CompoundIdentifier]]:
+        """Return the cached identifiers for a key or None if there are none"""
+        records = self._memory.get(key)
+        if records is not None:
+            self._memory.move_to_end(key)
+        elif self._connection is not None:
+            row = self._connection.execute(
+                """
+                SELECT identifiers FROM resolved
+                WHERE service = ? AND identifier_type = ? AND value = ? AND output_identifier_types = ?
+                """,
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            records = [tuple(record) for record in json.loads(row[0])]
+            self._remember(key, records)
+        else:
+            return None
+        # Return new objects, so callers cannot change the cached values
+        return [
+            CompoundIdentifier(
+                identifier_type=CompoundIdentifierType(identifier_type),
+                value=value,
+                details=details,
+            )
+            for identifier_type, value, details in records
+        ]
+
+    def set(self, key: CacheKey, identifiers: List[CompoundIdentifier]) -> None:
+        """Cache the identifiers resolved for a key"""
+        records = [
+            (identifier.identifier_type.value, identifier.value, identifier.details)
+            for identifier in identifiers
+            if identifier is not None
+        ]
+        self._remember(key, records)
+        if self._connection is not None:
+            # Committing every write would block the event loop, so commit in batches
+            self._connection.execute(
+                "INSERT OR REPLACE INTO resolved VALUES (?, ?, ?, ?, ?)",
+                (*key, json.dumps(records)),
+            )
+            self._n_uncommitted += 1
+            if self._n_uncommitted >= self.commit_interval:
+                self.flush()
+
+    def flush(self) -> None:
+        """Commit pending results to the database"""
+        if self._connection is not None and self._n_uncommitted > 0:
+            self._connection.commit()
+            self._n_uncommitted = 0
+
+    def close(self) -> None:
+        """Commit pending results and close the connection to the database"""
+        if self._connection is not None:
+            self.flush()
+            self._connection.close()
+            self._connection = None
+
+    def _remember(self, key: CacheKey, records: List[Tuple]) -> None:
+        self._memory[key] = records
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
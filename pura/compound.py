@@ -1,6 +1,7 @@
 from pura.units import *
 from rdkit import Chem
-from pydantic import BaseModel
+from pydantic import BaseModel, GetCoreSchemaHandler
+from pydantic_core import CoreSchema, core_schema
 from typing import Optional, List, Any, Union
 from enum import Enum
 import re
@@ -98,16 +99,95 @@ class Source:
     pass
 
 
-class CompoundIdentifier(BaseModel):
-    identifier_type: CompoundIdentifierType
-    value: str
-    details: Optional[str] = None
+class CompoundIdentifier:
+    """An immutable identifier of a compound (e.g., a name or SMILES string).
+
+    Identifiers are created for every request to every service, so this is a
+    plain class with __slots__ instead of a pydantic model. It can still be
+    used as a field of pydantic models such as :class:`~pura.compound.Compound`.
+
+    """
+
+    __slots__ = ("identifier_type", "value", "details")
+
+    def __init__(
+        self,
+        identifier_type: CompoundIdentifierType,
+        value: str,
+        details: Optional[str] = None,
+    ) -> None:
+        object.__setattr__(
+            self, "identifier_type", CompoundIdentifierType(identifier_type)
+        )
+        object.__setattr__(self, "value", value)
+        object.__setattr__(self, "details", details)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable.")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable.")
 
     def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, CompoundIdentifier):
+            return NotImplemented
         return (
             other.identifier_type == self.identifier_type and self.value == other.value
         )
 
+    def __hash__(self) -> int:
+        return hash((self.identifier_type, self.value))
+
+    def __repr__(self) -> str:
+        return (
+            f"CompoundIdentifier(identifier_type={self.identifier_type!r}, "
+            f"value={self.value!r}, details={self.details!r})"
+        )
+
+    def __reduce__(self):
+        return type(self), (self.identifier_type, self.value, self.details)
+
+    def dict(self):
+        return {
+            "identifier_type": self.identifier_type,
+            "value": self.value,
+            "details": self.details,
+        }
+
+    @classmethod
+    def __get_pydantic_core_schema__(
+        cls, source_type: Any, handler: GetCoreSchemaHandler
+    ) -> CoreSchema:
+        # Validate dictionaries field by field, then construct the identifier
+        fields_schema = core_schema.typed_dict_schema(
+            {
+                "identifier_type": core_schema.typed_dict_field(
+                    handler.generate_schema(CompoundIdentifierType)
+                ),
+                "value": core_schema.typed_dict_field(core_schema.str_schema()),
+                "details": core_schema.typed_dict_field(
+                    core_schema.with_default_schema(
+                        core_schema.nullable_schema(core_schema.str_schema()),
+                        default=None,
+                    ),
+                    required=False,
+                ),
+            },
+            extra_behavior="forbid",
+        )
+        from_dict_schema = core_schema.no_info_after_validator_function(
+            lambda fields: cls(**fields), fields_schema
+        )
+        return core_schema.json_or_python_schema(
+            json_schema=from_dict_schema,
+            python_schema=core_schema.union_schema(
+                [core_schema.is_instance_schema(cls), from_dict_schema]
+            ),
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                lambda identifier: identifier.dict(), return_schema=fields_schema
+            ),
+        )
+
 
 pura_to_rdkit_converters = {
     CompoundIdentifierType.SMILES: Chem.MolFromSmiles,
@@ -173,7 +253,8 @@ def unique_identifiers(identifiers: List[CompoundIdentifier]):
     return unique_identifiers
 
 
-def standardize_identifier(identifier: CompoundIdentifier):
+def standardize_identifier(identifier: CompoundIdentifier) -> CompoundIdentifier:
+    """Return a standardized copy of an identifier (e.g., with canonical SMILES)"""
     if (identifier.identifier_type == CompoundIdentifierType.SMILES) or (identifier.identifier_type==CompoundIdentifierType.ISOMERIC_SMILES):
         smi = identifier.value
         # check smi and raise warnings
@@ -228,4 +309,9 @@ def standardize_identifier(identifier: CompoundIdentifier):
                     warnings.warn("Warning: SMILES string contains isotopes.")
             Chem.SanitizeMol(mol)
             mol.UpdatePropertyCache(strict=False)
-            identifier.value = Chem.MolToSmiles(mol)
+            identifier = CompoundIdentifier(
+                identifier_type=identifier.identifier_type,
+                value=Chem.MolToSmiles(mol),
+                details=identifier.details,
+            )
+    return identifier
@@ -6,32 +6,29 @@ from pura.compound import (
     unique_identifiers,
 )
 from pura.services import *
+from pura.cache import CacheKey, ResolverCache
 from tqdm import tqdm
 from aiohttp import *
-from aiohttp.web_exceptions import (
-    HTTPClientError,
-    HTTPServerError,
-    HTTPServiceUnavailable,
-)
 import asyncio
 import nest_asyncio
 
-from typing import Optional, List, Union, Tuple, Dict, Callable
-from itertools import combinations
-from functools import reduce
+from typing import Optional, List, Union, Tuple, Dict, Callable, AsyncIterator
+from collections import Counter
 import logging
+import random
+import time
 import numpy as np
 
 try:
-    nest_asyncio.apply()
-except RuntimeError:
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+    import uvloop
+except ImportError:
+    uvloop = None
+# uvloop.run was added in uvloop 0.18
+run_coroutine = getattr(uvloop, "run", None) or asyncio.run
 
 logger = logging.getLogger(__name__)
 
 aiohttp_errors = (
-    HTTPServiceUnavailable,
     ClientConnectionError,
     TimeoutError,
     ClientConnectorCertificateError,
@@ -54,6 +51,74 @@ aiohttp_errors = (
     asyncio.TimeoutError,
 )
 
+# HTTP status codes that mean a service is busy, so the request should be retried
+RETRY_STATUS_CODES = (429, 503)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Return True if a request that raised an error should be retried"""
+    if isinstance(error, ContentTypeError):
+        # Usually an HTML error page from an overloaded server
+        return True
+    if isinstance(error, ClientResponseError):
+        return error.status in RETRY_STATUS_CODES
+    return True
+
+
+def backoff_delay(attempt: int) -> float:
+    """Return the seconds to sleep before retrying a request after a failed attempt.
+
+    The exponential backoff is randomly scaled (jitter), so requests that failed
+    together do not retry together.
+
+    """
+    return min(2**attempt, 30) * (0.5 + random.random())
+
+
+class CircuitBreaker:
+    """Stop sending requests to a service that keeps failing.
+
+    Parameters
+    ----------
+    failure_threshold : int, optional
+        The number of consecutive failures after which the breaker opens and
+        requests are skipped. If None, the breaker never opens. Default is 20.
+    reset_timeout : float, optional
+        The number of seconds to wait after opening before letting a request
+        through to check whether the service has recovered. Default is 30.
+
+    """
+
+    def __init__(
+        self, failure_threshold: Optional[int] = 20, reset_timeout: float = 30.0
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.n_failures = 0
+        self.opened_at = None
+
+    def allow_request(self) -> bool:
+        """Return True if a request can be sent to the service"""
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            # Let one request through to probe whether the service has recovered
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        self.n_failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.n_failures += 1
+        if (
+            self.failure_threshold is not None
+            and self.n_failures >= self.failure_threshold
+        ):
+            self.opened_at = time.monotonic()
+
 
 def base_check_agreement(
     identifiers_list: List[List[CompoundIdentifier]],
@@ -86,36 +151,30 @@ def base_check_agreement(
     ------
 
     Algorithm:
-    1. Find all combinatons of services that can satisfy agreement (combinations)
-    2. Find the intersection of each combination
-    3. If the intersection is greater than zero, then you have sufficient agreement.
+    1. Count the number of services that returned each identifier
+    2. Keep the identifiers returned by at least `agreement` services
+    3. If any identifiers are kept, then you have sufficient agreement.
 
     """
     if agreement <= 0:
         raise ValueError("Agreement must be greater than 0.")
-    identifiers_list_new = []
+    counts = Counter()
+    identifier_type = None
     for identifiers in identifiers_list:
         if len(identifiers) > 0:
-            identifiers_list_new.append(
-                [identifier.value for identifier in identifiers]
+            # Count each service once, keeping the order identifiers were returned in
+            counts.update(
+                list(dict.fromkeys(identifier.value for identifier in identifiers))
             )
             identifier_type = identifiers[0].identifier_type
-    identifiers_sets = [set(ident) for ident in identifiers_list_new]
-    options = list(range(len(identifiers_list_new)))
-    intersection = []
-    for combo in combinations(options, agreement):
-        intersection = reduce(
-            set.intersection, [identifiers_sets[combo_i] for combo_i in combo]
-        )
-        if len(intersection) > 0:
-            break
-    if len(intersection) == 0:
+    agreed = [value for value, count in counts.items() if count >= agreement]
+    if len(agreed) == 0:
         return identifiers_list, False
     else:
         return [
             [
                 CompoundIdentifier(identifier_type=identifier_type, value=identifier)
-                for identifier in intersection
+                for identifier in agreed
             ]
         ], True
 
@@ -133,6 +192,26 @@ class CompoundResolver:
     agreement_check : callable, optional
         A function that checks for agreement. See :class:`~pura.resolvers.base_check_agreement`
         for the API and the default agreement_check function.
+    service_failures_threshold : int, optional
+        The total number of failures that can occur on a particular service before that
+        service is no longer used, even to check whether it has recovered. Default is None,
+        so failing services are only skipped temporarily by the circuit breaker.
+    limit_per_host : int, optional
+        The maximum number of open connections to each host. Default is None,
+        which means no limit, so each service is only throttled by its own
+        max_concurrency (e.g., 5 for PubChem).
+    cache : bool or :class:`~pura.cache.ResolverCache`, optional
+        Cache for the results of each service. If True (the default), results are
+        cached in memory. Pass a :class:`~pura.cache.ResolverCache` with a path
+        to persist results across runs. If False, results are not cached, but
+        results of batch requests are still kept until they are used.
+    failure_threshold : int, optional
+        The number of consecutive failures of a service after which it is skipped
+        for reset_timeout seconds (see :class:`~pura.resolvers.CircuitBreaker`).
+        If None, services are never skipped temporarily. Default is 20.
+    reset_timeout : float, optional
+        The number of seconds a failing service is skipped before one request
+        is let through to check whether it has recovered. Default is 30.
 
     Examples
     --------
@@ -172,7 +251,11 @@ class CompoundResolver:
         services: List[Service],
         silent: Optional[bool] = False,
         agreement_check: Optional[Callable] = None,
-        service_failures_threshold: Optional[int] = 10,
+        service_failures_threshold: Optional[int] = None,
+        limit_per_host: Optional[int] = None,
+        cache: Optional[Union[bool, ResolverCache]] = True,
+        failure_threshold: Optional[int] = 20,
+        reset_timeout: Optional[float] = 30.0,
     ):
         self._services = services
         self.silent = silent
@@ -180,6 +263,44 @@ class CompoundResolver:
             agreement_check if agreement_check is not None else base_check_agreement
         )
         self.service_failures_threshold = service_failures_threshold
+        self.limit_per_host = limit_per_host
+        self._circuit_breakers = {
+            service: CircuitBreaker(
+                failure_threshold=failure_threshold, reset_timeout=reset_timeout
+            )
+            for service in services
+        }
+        if cache is True:
+            cache = ResolverCache()
+        elif cache is False:
+            cache = None
+        self.cache = cache
+        self._session = None
+
+    async def __aenter__(self):
+        """Open a client session that is reused by every call to the resolver.
+
+        Reusing a session keeps connections to the services alive, so TCP and TLS
+        handshakes are not repeated for every request.
+
+        """
+        self._session = self._create_session()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+        self._session = None
+
+    def _create_session(self) -> ClientSession:
+        """Create a client session with a per-host limit on connections"""
+        connector = TCPConnector(
+            limit=0,
+            limit_per_host=self.limit_per_host or 0,
+            enable_cleanup_closed=True,
+            ttl_dns_cache=600,
+            keepalive_timeout=75,
+        )
+        return ClientSession(connector=connector, timeout=ClientTimeout(total=60))
 
     def resolve(
         self,
@@ -217,13 +338,20 @@ class CompoundResolver:
         service_failures_threshold : int, optional
             The number of failures that can occur on a particular service before that service
             is no longer used. This is useful for cases where a service is down for a long period of time.
-            Defaults to 10.
+            Defaults to None.
 
         Notes
         -----
 
-        The retries option uses an exponential backoff, so a sleep of 2^n seconds will occur before
-        the next retry, where n is the number of retries thus far.
+        The retries option uses an exponential backoff, so a sleep of about 2^n seconds
+        (randomly scaled by 0.5-1.5x and capped at 30 seconds before scaling) will occur
+        before the next retry, where n is the number of retries thus far. A service that
+        fails failure_threshold times in a row is skipped for reset_timeout seconds
+        before being tried again.
+
+        If no event loop is running, a new one is started for the resolution, using
+        uvloop if version 0.18 or later is installed. Inside a running event loop
+        (e.g., in Jupyter), the resolution runs in that loop.
 
         Returns
         -------
@@ -232,33 +360,23 @@ class CompoundResolver:
         element is a list of compound identifier(s).
 
         """
-        # Make sure output identifier type is different than backup identifier types
-        if (
-            backup_identifier_types is not None
-            and output_identifier_type in backup_identifier_types
-        ):
-            raise ValueError(
-                "Output identifier type cannot be in backup identifier types."
-            )
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError as e:
-            if str(e).startswith("There is no current event loop in thread"):
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            else:
-                raise
-        return loop.run_until_complete(
-            self._resolve(
-                input_compounds=input_compounds,
-                output_identifier_type=output_identifier_type,
-                backup_identifier_types=backup_identifier_types,
-                agreement=agreement,
-                batch_size=batch_size,
-                n_retries=n_retries,
-                **kwargs,
-            )
+        coroutine = self._resolve(
+            input_compounds=input_compounds,
+            output_identifier_type=output_identifier_type,
+            backup_identifier_types=backup_identifier_types,
+            agreement=agreement,
+            batch_size=batch_size,
+            n_retries=n_retries,
+            **kwargs,
         )
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop is running, so start one (using uvloop if installed)
+            return run_coroutine(coroutine)
+        # Already inside a running event loop (e.g., Jupyter), so nest in it
+        nest_asyncio.apply()
+        return asyncio.get_event_loop().run_until_complete(coroutine)
 
     async def _resolve(
         self,
@@ -271,6 +389,83 @@ class CompoundResolver:
         **kwargs,
     ) -> List[Tuple[Compound, Union[List[CompoundIdentifier], None]]]:
         """This is the async function with the same API as resolve"""
+        resolved_identifiers = [None] * len(input_compounds)
+        async for i, result in self._iter_resolve(
+            input_compounds=input_compounds,
+            output_identifier_type=output_identifier_type,
+            backup_identifier_types=backup_identifier_types,
+            agreement=agreement,
+            batch_size=batch_size,
+            n_retries=n_retries,
+            **kwargs,
+        ):
+            resolved_identifiers[i] = result
+        return resolved_identifiers
+
+    async def iter_resolve(
+        self,
+        input_compounds: List[Compound],
+        output_identifier_type: CompoundIdentifierType,
+        backup_identifier_types: Optional[List[CompoundIdentifierType]] = None,
+        agreement: Optional[int] = 1,
+        batch_size: Optional[int] = None,
+        n_retries: Optional[int] = 3,
+        **kwargs,
+    ) -> AsyncIterator[Tuple[Compound, Union[List[CompoundIdentifier], None]]]:
+        """Resolve compounds, yielding each result as soon as it is ready.
+
+        This has the same parameters as :meth:`resolve`, but results are yielded
+        in the order they finish instead of being collected into a list. Only
+        batch_size compounds are resolved at a time, so results can be written
+        out incrementally for very large lists of compounds.
+
+        Examples
+        --------
+
+        >>> async for input_compound, resolved_identifiers in resolver.iter_resolve(
+        ...     input_compounds=compounds,
+        ...     output_identifier_type=CompoundIdentifierType.SMILES,
+        ... ):
+        ...     print(input_compound, resolved_identifiers)
+
+        """
+        results = self._iter_resolve(
+            input_compounds=input_compounds,
+            output_identifier_type=output_identifier_type,
+            backup_identifier_types=backup_identifier_types,
+            agreement=agreement,
+            batch_size=batch_size,
+            n_retries=n_retries,
+            **kwargs,
+        )
+        try:
+            async for _, result in results:
+                yield result
+        finally:
+            # Cancel pending requests and tear down services if closed early
+            await results.aclose()
+
+    async def _iter_resolve(
+        self,
+        input_compounds: List[Compound],
+        output_identifier_type: CompoundIdentifierType,
+        backup_identifier_types: Optional[List[CompoundIdentifierType]] = None,
+        agreement: Optional[int] = 1,
+        batch_size: Optional[int] = None,
+        n_retries: Optional[int] = 3,
+        **kwargs,
+    ) -> AsyncIterator[
+        Tuple[int, Tuple[Compound, Union[List[CompoundIdentifier], None]]]
+    ]:
+        """Yield the index of each input compound with its result as soon as it is ready"""
+        # Make sure output identifier type is different than backup identifier types
+        if (
+            backup_identifier_types is not None
+            and output_identifier_type in backup_identifier_types
+        ):
+            raise ValueError(
+                "Output identifier type cannot be in backup identifier types."
+            )
 
         # Run setup for services
         for service in self.services:
@@ -279,12 +474,17 @@ class CompoundResolver:
         n_identifiers = len(input_compounds)
         if batch_size is None:
             batch_size = 10 if n_identifiers >= 10 else n_identifiers
-        n_batches = n_identifiers // batch_size
-        n_batches += 0 if n_identifiers % batch_size == 0 else 1
-        resolved_identifiers = []
+        batch_size = max(batch_size, 1)
         backup_identifier_types = (
             backup_identifier_types if backup_identifier_types is not None else []
         )
+        # Use the session of the context manager if there is one,
+        # otherwise open one session for the whole resolution
+        session = self._session
+        close_session = session is None
+        if close_session:
+            session = self._create_session()
+
         progress_bar_type = kwargs.get("progress_bar_type", "tqdm")
         if progress_bar_type == "tqdm":
             progress_bar = tqdm
@@ -292,44 +492,78 @@ class CompoundResolver:
             from stqdm import stqdm
 
             progress_bar = stqdm
-        # Iterate through batches
-        for batch in progress_bar(range(n_batches), position=0, desc="Batch"):
-            # Get subset of data
-            start = batch * batch_size
-            batch_identifiers = input_compounds[start : start + batch_size]
-
-            # Start aiohttp session
-            async with ClientSession() as session:
-                # Create series of tasks to run in parallel
-                tasks = [
-                    self._resolve_one_compound(
-                        session,
-                        compound_identifier,
-                        output_identifier_type,
-                        backup_identifier_types,
-                        agreement,
-                        n_retries=n_retries,
+
+        # Only resolve each unique compound once, but remember where the duplicates are
+        unique_compounds = {}
+        for i, input_compound in enumerate(input_compounds):
+            unique_compounds.setdefault(compound_key(input_compound), []).append(i)
+
+        # Without a resolver cache, batch results are kept until they are used
+        prefetched = {}
+
+        bar = progress_bar(total=len(unique_compounds), desc="Progress", position=0)
+        pending = set()
+        try:
+            # Look up identifiers that services can resolve in batches ahead of time
+            await self._prefetch(
+                session,
+                prefetched,
+                [input_compounds[indices[0]] for indices in unique_compounds.values()],
+                [output_identifier_type] + backup_identifier_types,
+                n_retries=n_retries,
+            )
+
+            # Keep batch_size compounds in flight at all times
+            queued = iter(unique_compounds.values())
+            tasks = {}
+            while True:
+                for indices in queued:
+                    task = asyncio.ensure_future(
+                        self._resolve_one_compound(
+                            session,
+                            prefetched,
+                            input_compounds[indices[0]],
+                            output_identifier_type,
+                            backup_identifier_types,
+                            agreement,
+                            n_retries=n_retries,
+                        )
                     )
-                    for compound_identifier in batch_identifiers
-                ]
-                batch_bar = progress_bar(
-                    asyncio.as_completed(tasks),
-                    total=len(tasks),
-                    desc=f"Batch {batch} Progress",
-                    position=1,
-                    leave=True,
+                    tasks[task] = indices
+                    pending.add(task)
+                    if len(pending) >= batch_size:
+                        break
+                if len(pending) == 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
                 )
-                resolved_identifiers.extend([await f for f in batch_bar])
-                batch_bar.clear()
+                for task in done:
+                    _, resolved = task.result()
+                    bar.update(1)
+                    # Send the result to every duplicate of the compound
+                    for i in tasks.pop(task):
+                        yield i, (input_compounds[i], list(resolved))
+        finally:
+            bar.close()
 
-        for service in self.services:
-            await service.teardown()
+            for task in pending:
+                task.cancel()
 
-        return resolved_identifiers
+            if close_session:
+                await session.close()
+
+            for service in self.services:
+                await service.teardown()
+
+            # Persist the results of this resolution
+            if self.cache is not None:
+                self.cache.flush()
 
     async def _resolve_one_compound(
         self,
         session: ClientSession,
+        prefetched: Dict[CacheKey, List[CompoundIdentifier]],
         input_compound: Compound,
         output_identifier_type: CompoundIdentifierType,
         backup_identifier_types: List[CompoundIdentifierType],
@@ -343,12 +577,9 @@ class CompoundResolver:
         input_identifiers_list = [
             (identifier, None) for identifier in input_compound.identifiers
         ]
-
-        threshold = (
-            self.service_failures_threshold
-            if self.service_failures_threshold is not None
-            else np.inf
-        )
+        # Whether services were tried or skipped after repeated failures
+        service_tried = False
+        service_skipped = False
 
         # Main loop
         while len(input_identifiers_list) > 0 and not agreement_satisfied:
@@ -357,9 +588,15 @@ class CompoundResolver:
             for service in self.services:
                 if service == no_go_service:
                     continue
+                circuit_breaker = self._circuit_breakers[service]
                 for j in range(n_retries):
-                    if service.n_failures >= threshold:
+                    if not self._service_available(service):
+                        logger.warning(
+                            f"{service} skipped for {input_identifier.value} after repeated failures"
+                        )
+                        service_skipped = True
                         break
+                    service_tried = True
                     try:
                         output_identifier_types = [
                             output_identifier_type
@@ -368,8 +605,10 @@ class CompoundResolver:
                         #     output_identifier_types.remove(
                         #         input_identifier.identifier_type
                         #     )
-                        resolved_identifiers = await service.resolve_compound(
+                        resolved_identifiers = await self._resolve_with_cache(
+                            service,
                             session,
+                            prefetched,
                             input_identifier=input_identifier,
                             output_identifier_types=output_identifier_types,
                         )
@@ -392,25 +631,29 @@ class CompoundResolver:
 
                             # Standardize identifiers (e.g., SMILES canonicalization)
                             if identifier is not None:
-                                standardize_identifier(identifier)
+                                identifier = standardize_identifier(identifier)
 
                             final_resolved_identifiers.append(identifier)
 
                         resolved_identifiers_list.append(final_resolved_identifiers)
+                        circuit_breaker.record_success()
                         break
                     except aiohttp_errors as e:  # type: ignore
-                        # If server is busy, use exponential backoff
-                        logger.debug(f"Sleeping for {2**j} ({e})")
-                        service.n_failures += 1
-                        await asyncio.sleep(2**j)
-                    except (HTTPClientError, HTTPServerError) as e:
-                        # Log/raise on all other HTTP errors
                         service.n_failures += 1
-                        if self.silent:
-                            logger.error(msg=f"{service}, {input_identifier}: {e}")
-                            break
-                        else:
-                            raise e
+                        if not is_retryable(e):
+                            # Log/raise on all other HTTP errors
+                            if e.status >= 500:
+                                circuit_breaker.record_failure()
+                            if self.silent:
+                                logger.error(msg=f"{service}, {input_identifier}: {e}")
+                                break
+                            else:
+                                raise e
+                        # If server is busy, use exponential backoff with jitter
+                        delay = backoff_delay(j)
+                        logger.debug(f"Sleeping for {delay:.1f} ({e})")
+                        circuit_breaker.record_failure()
+                        await asyncio.sleep(delay)
                     except ValueError as e:
                         if self.silent:
                             logger.error(e)
@@ -438,6 +681,15 @@ class CompoundResolver:
                 if agreement_satisfied:
                     break
 
+        # Do not report a compound as unresolved when no service could be asked
+        if service_skipped and not service_tried:
+            error_txt = f"All services were skipped for {input_compound} after repeated failures"
+            if self.silent:
+                logger.error(error_txt)
+                return input_compound, []
+            else:
+                raise ResolverError(error_txt)
+
         # If agreement is 0 or 1, then we just want to dedup and return
         if agreement == 0 or agreement == 1:
             resolved_identifiers_list = [
@@ -455,12 +707,125 @@ class CompoundResolver:
                 raise ResolverError(error_txt)
         return input_compound, flatten_list(resolved_identifiers_list)
 
+    def _service_available(self, service: Service) -> bool:
+        """Return True if requests can be sent to a service"""
+        threshold = (
+            self.service_failures_threshold
+            if self.service_failures_threshold is not None
+            else np.inf
+        )
+        if service.n_failures >= threshold:
+            return False
+        return self._circuit_breakers[service].allow_request()
+
+    async def _prefetch(
+        self,
+        session: ClientSession,
+        prefetched: Dict[CacheKey, List[CompoundIdentifier]],
+        input_compounds: List[Compound],
+        output_identifier_types: List[CompoundIdentifierType],
+        n_retries: Optional[int],
+    ) -> None:
+        """Look up identifiers in batches for services that support them"""
+        for service in self.services:
+            input_identifiers = []
+            for input_compound in input_compounds:
+                for identifier in input_compound.identifiers:
+                    if identifier.identifier_type not in service.batch_identifier_types:
+                        continue
+                    key = ResolverCache.make_key(
+                        service.cache_key, identifier, output_identifier_types
+                    )
+                    if self.cache is None or self.cache.get(key) is None:
+                        input_identifiers.append(identifier)
+            if len(input_identifiers) == 0:
+                continue
+            circuit_breaker = self._circuit_breakers[service]
+            results = None
+            for j in range(n_retries):
+                if not self._service_available(service):
+                    break
+                try:
+                    results = await service.resolve_compounds(
+                        session,
+                        input_identifiers=input_identifiers,
+                        output_identifier_types=output_identifier_types,
+                    )
+                    circuit_breaker.record_success()
+                    break
+                except aiohttp_errors as e:  # type: ignore
+                    if not is_retryable(e):
+                        # Compounds will be resolved one at a time instead, since
+                        # one bad identifier (e.g., an invalid CID) fails the batch
+                        logger.debug(f"{service} | Batch request failed ({e})")
+                        if e.status >= 500:
+                            service.n_failures += 1
+                            circuit_breaker.record_failure()
+                        break
+                    delay = backoff_delay(j)
+                    logger.debug(
+                        f"{service} | Batch request failed, sleeping for {delay:.1f} ({e})"
+                    )
+                    service.n_failures += 1
+                    circuit_breaker.record_failure()
+                    await asyncio.sleep(delay)
+                except ValueError as e:
+                    # The service cannot resolve to these output identifier types,
+                    # which is reported when compounds are resolved one at a time
+                    logger.debug(f"{service} | Batch request failed ({e})")
+                    break
+            if results is None:
+                continue
+            for identifier, resolved_identifiers in zip(input_identifiers, results):
+                key = ResolverCache.make_key(
+                    service.cache_key, identifier, output_identifier_types
+                )
+                if self.cache is not None:
+                    self.cache.set(key, resolved_identifiers)
+                else:
+                    prefetched[key] = resolved_identifiers
+
+    async def _resolve_with_cache(
+        self,
+        service: Service,
+        session: ClientSession,
+        prefetched: Dict[CacheKey, List[CompoundIdentifier]],
+        input_identifier: CompoundIdentifier,
+        output_identifier_types: List[CompoundIdentifierType],
+    ) -> List[CompoundIdentifier]:
+        """Resolve with a service, using cached or prefetched results when available"""
+        key = ResolverCache.make_key(
+            service.cache_key, input_identifier, output_identifier_types
+        )
+        if self.cache is not None:
+            resolved_identifiers = self.cache.get(key)
+        else:
+            # Without a cache, prefetched results are only needed once
+            resolved_identifiers = prefetched.pop(key, None)
+        if resolved_identifiers is None:
+            resolved_identifiers = await service.resolve_compound(
+                session,
+                input_identifier=input_identifier,
+                output_identifier_types=output_identifier_types,
+            )
+            if self.cache is not None:
+                self.cache.set(key, resolved_identifiers)
+        return resolved_identifiers
+
     @property
     def services(self):
         """Return services"""
         return self._services
 
 
+def compound_key(compound: Compound) -> Tuple[Tuple[str, str], ...]:
+    """Key that is the same for compounds with the same identifiers"""
+    return tuple(
+        (identifier.identifier_type.value, identifier.value)
+        for identifier in compound.identifiers
+    )
+
+
 def flatten_list(l: List):
     """Flatten a multidimensional list to one dimension"""
     lnew = []
@@ -538,21 +903,21 @@ def resolve_identifiers(
     This is a convenience function for quickly resolving a list of strings without having
     to create Compound objects.
 
-    Due to the asynchronous nature of the API calls, the function will not
-    return the results in the same order as the input list.
+    The results are returned in the same order as the input list.
 
     """
     if services is None:
         services = [PubChem(autocomplete=True), CIR()]
 
-    # Convert to Compound objects
+    # Convert unique names to Compound objects, since names are often repeated
+    unique_names = list(dict.fromkeys(names))
     compounds = [
         Compound(
             identifiers=[
                 CompoundIdentifier(identifier_type=input_identifer_type, value=name)
             ]
         )
-        for name in names
+        for name in unique_names
     ]
 
     # Do the actual resolving
@@ -565,11 +930,9 @@ def resolve_identifiers(
         batch_size=batch_size,
     )
 
-    # Return results
-    return [
-        (
-            input_compound.identifiers[0].value,
-            [identifier.value for identifier in resolved_identifiers],
-        )
-        for input_compound, resolved_identifiers in results
-    ]
+    # Return results for every input name, including duplicates
+    resolved_values = {
+        name: [identifier.value for identifier in resolved_identifiers]
+        for name, (_, resolved_identifiers) in zip(unique_names, results)
+    }
+    return [(name, list(resolved_values[name])) for name in names]
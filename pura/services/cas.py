@@ -1,9 +1,8 @@
 from pura.services import Service
 from pura.compound import CompoundIdentifier, CompoundIdentifierType
 from pura.utils import inverse_map
-from aiohttp import ClientSession
+from aiohttp import ClientSession, ClientResponseError
 from typing import List, Union
-from aiohttp.web_exceptions import HTTPNotFound
 import logging
 
 BASE_API = "https://rboq1qukh0.execute-api.us-east-2.amazonaws.com"
@@ -23,6 +22,7 @@ OUTPUT_IDENTIFIER_MAP = {
     CompoundIdentifierType.INCHI: "stdinchi",
     CompoundIdentifierType.INCHI_KEY: "inchiKey",
 }
+INVERSE_OUTPUT_IDENTIFIER_MAP = inverse_map(OUTPUT_IDENTIFIER_MAP)
 
 
 class CAS(Service):
@@ -56,10 +56,9 @@ class CAS(Service):
             output_representations,
         )
 
-        inv_identifier_map = inverse_map(OUTPUT_IDENTIFIER_MAP)
         return [
             CompoundIdentifier(
-                identifier_type=inv_identifier_map[output_representation],
+                identifier_type=INVERSE_OUTPUT_IDENTIFIER_MAP[output_representation],
                 value=result,
             )
             for output_representation, result in results.items()
@@ -80,7 +79,12 @@ async def common_chemistry_request(
     async with session.get(api_url, params=params) as resp:
         logger.debug(f"Response status: {resp.status}")
         if resp.status == 404:
-            raise HTTPNotFound(text=f"Failed request for {identifier}")
+            raise ClientResponseError(
+                resp.request_info,
+                resp.history,
+                status=resp.status,
+                message=f"Failed request for {identifier}",
+            )
         response = await resp.json()
     return {
         output_representation: response.get(output_representation)
@@ -103,6 +103,7 @@ class ChemSpider(Service):
                     "No Chemspider API token passed or found in the environment."
                 )
         self.token = token
+        super().__init__()
 
     async def resolve_compound(
         self,
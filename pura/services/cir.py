@@ -99,6 +99,13 @@ class CIR(Service):
         self.specify_input_identifier_type = specify_input_identifier_type
         super().__init__()
 
+    @property
+    def cache_key(self) -> str:
+        # Specifying the input identifier type changes the results, so cache modes separately
+        if self.specify_input_identifier_type:
+            return "CIR(specify_input_identifier_type=True)"
+        return "CIR"
+
     async def resolve_compound(
         self,
         session: ClientSession,
@@ -119,10 +119,18 @@ class LocalDatabase(Service):
     def __init__(
         self, db_path: Optional[str] = None, return_canonical_only: bool = True
     ) -> None:
-        db_path = db_path or DATA_PATH / "pura.db"
-        db_path = f"sqlite+aiosqlite:///{db_path}"
-        self.db = AsyncDatabase(db_path)
+        self.db_path = str(db_path or DATA_PATH / "pura.db")
+        self.db = AsyncDatabase(f"sqlite+aiosqlite:///{self.db_path}")
         self.return_canonical_only = return_canonical_only
+        super().__init__()
+
+    @property
+    def cache_key(self) -> str:
+        # Each database and mode gives different results, so cache them separately
+        return (
+            f"LocalDatabase(db_path={self.db_path!r}, "
+            f"return_canonical_only={self.return_canonical_only})"
+        )
 
     async def setup(self):
         await self.db.connect()
@@ -1,7 +1,6 @@
 from pura.services import Service
 from pura.compound import CompoundIdentifier, CompoundIdentifierType
-from aiohttp import ClientSession
-from aiohttp.web_exceptions import HTTPNotFound
+from aiohttp import ClientSession, ClientResponseError
 from typing import List, Union
 from urllib.parse import quote
 import logging
@@ -61,6 +60,11 @@ async def opsin_request(
     async with session.get(api_url) as resp:
         logging.debug(f"Response status: {resp.status}")
         if resp.status == 404:
-            raise HTTPNotFound(text=f"Failed request for {name}")
+            raise ClientResponseError(
+                resp.request_info,
+                resp.history,
+                status=resp.status,
+                message=f"Failed request for {name}",
+            )
         response = await resp.json()
     return response.get(output_representation)
@@ -5,24 +5,21 @@ PubChemPy
 Python interface for the PubChem PUG REST service.
 https://github.com/mcs07/PubChemPy
 """
-from queue import Queue
+from collections import deque
 from urllib.parse import quote, urlencode
 from pura.services import Service
 from pura.compound import CompoundIdentifier, CompoundIdentifierType
 from pura.utils import inverse_map
-from aiohttp import ClientSession
-from aiohttp.web_exceptions import (
-    HTTPBadRequest,
-    HTTPNotFound,
-    HTTPServiceUnavailable,
-    HTTPMethodNotAllowed,
-    HTTPGatewayTimeout,
-    HTTPNotImplemented,
-    HTTPInternalServerError,
-)
-from typing import List, Optional, Union
+from aiohttp import ClientSession, ClientResponseError
+from typing import List, Optional, Tuple, Union
+import asyncio
 import logging
 
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +50,18 @@ OUTPUT_IDENTIFIER_MAP = {
     CompoundIdentifierType.PUBCHEM_CID: "CID",
     CompoundIdentifierType.ISOMERIC_SMILES: "IsomericSMILES",
 }
+INVERSE_OUTPUT_IDENTIFIER_MAP = inverse_map(OUTPUT_IDENTIFIER_MAP)
+# HTTP status codes of the faults returned by PUG REST
+FAULT_STATUS_MAP = {
+    "PUGREST.BadRequest": 400,
+    "PUGREST.NotFound": 404,
+    "PUGREST.NotAllowed": 405,
+    "PUGREST.ServerError": 500,
+    "PUGREST.Unknown": 500,
+    "PUGREST.Unimplemented": 501,
+    "PUGREST.ServerBusy": 503,
+    "PUGREST.Timeout": 504,
+}
 PROPERTY_EXCEPTIONS = [OUTPUT_IDENTIFIER_MAP.get(CompoundIdentifierType.PUBCHEM_CID)]
 # Allows properties to optionally be specified as underscore_separated, consistent with Compound attributes
 PROPERTY_MAP = {
@@ -107,6 +116,12 @@ class PubChem(Service):
     autocomplete: bool
         If the input identifier cannot be found, you can try autocomplete to have PubChem find alternative names.
         Default is False.
+    max_concurrency: int
+        The maximum number of requests in flight to PubChem at once. Default is 5.
+        This caps simultaneous requests, not requests per second, so PubChem's
+        limit of 5 requests per second can still be exceeded when responses are fast.
+    batch_request_size: int
+        The maximum number of PubChem CIDs looked up in one request. Default is 100.
 
     Notes
     -----
@@ -114,83 +129,221 @@ class PubChem(Service):
 
     """
 
-    def __init__(self, autocomplete: bool = False, autocomplete_limit: int = 1) -> None:
+    batch_identifier_types = [CompoundIdentifierType.PUBCHEM_CID]
+
+    def __init__(
+        self,
+        autocomplete: bool = False,
+        autocomplete_limit: int = 1,
+        max_concurrency: Optional[int] = 5,
+        batch_request_size: int = 100,
+    ) -> None:
         self.autocomplete = autocomplete
         self.autocomplete_limit = autocomplete_limit
-        super().__init__()
+        self.batch_request_size = batch_request_size
+        self._properties_operations = {}
+        super().__init__(max_concurrency=max_concurrency)
+
+    @property
+    def cache_key(self) -> str:
+        # Autocomplete changes the results, so cache the two modes separately
+        if self.autocomplete:
+            return f"PubChem(autocomplete_limit={self.autocomplete_limit})"
+        return "PubChem"
+
+    def _get_properties_operation(
+        self, output_identifier_types: List[CompoundIdentifierType]
+    ) -> Tuple[List[str], str]:
+        """Get the representations and properties operation for some output identifier types.
+
+        The same output identifier types are requested for every compound, so the
+        result is cached.
+
+        """
+        key = tuple(output_identifier_types)
+        if key not in self._properties_operations:
+            representations, properties = get_representations(output_identifier_types)
+            self._properties_operations[key] = (
+                representations,
+                properties_operation(properties),
+            )
+        return self._properties_operations[key]
 
     async def resolve_compound(
         self,
         session: ClientSession,
         input_identifier: CompoundIdentifier,
         output_identifier_types: List[CompoundIdentifierType],
+    ) -> List[Union[CompoundIdentifierType, None]]:
+        async with self.limit():
+            return await self._resolve_compound(
+                session, input_identifier, output_identifier_types
+            )
+
+    async def _resolve_compound(
+        self,
+        session: ClientSession,
+        input_identifier: CompoundIdentifier,
+        output_identifier_types: List[CompoundIdentifierType],
     ) -> List[Union[CompoundIdentifierType, None]]:
         namespace = INPUT_IDENTIFIER_MAP.get(input_identifier.identifier_type)
-        # print(namespace)
         if namespace is None:
             raise ValueError(
                 f"{input_identifier.identifier_type} is not one of the valid identifier types for PubChem."
             )
-        representations = [
-            OUTPUT_IDENTIFIER_MAP.get(output_identifier_type)
-            for output_identifier_type in output_identifier_types
-        ]
-        representations = list(set(representations))
-        if None in representations:
-            representations.remove(None)
-        if not any(representations):
-            raise ValueError(
-                f"{output_identifier_types} contains invalid identifier types for PubChem."
-            )
-        if PROPERTY_EXCEPTIONS:
-            properties = [
-                representation
-                for representation in representations
-                if representation not in PROPERTY_EXCEPTIONS
-            ]
-        else:
-            properties = representations
+        representations, operation = self._get_properties_operation(
+            output_identifier_types
+        )
 
         # Search
-        input_identifiers_queue = Queue()
-        input_identifiers_queue.put(input_identifier.value)
+        pending = deque([input_identifier.value])
         autocomplete_tried = False
-        while not input_identifiers_queue.empty():
-            input_value = input_identifiers_queue.get()
+        output_identifiers = []
+        while pending:
+            input_value = pending.popleft()
             results = await get_properties(
                 session,
-                properties=properties,
+                properties=None,
                 identifier=input_value,
+                operation=operation,
                 namespace=namespace,
                 searchtype=None,
             )
-            output_identifiers = []
-            for representation in representations:
-                for result in results:
-                    if result and result.get(representation):
-                        output_identifiers += [
-                            CompoundIdentifier(
-                                identifier_type=inverse_map(OUTPUT_IDENTIFIER_MAP)[
-                                    representation
-                                ],
-                                value=str(result[representation]),
-                            )
-                        ]
+            output_identifiers += parse_properties(results, representations)
+
+            # Autocomplete is only a fallback, so stop at the first match
+            if len(output_identifiers) > 0:
+                break
 
             # Autocomplete if search fails
-            if (
-                len(output_identifiers) == 0
-                and self.autocomplete
-                and not autocomplete_tried
-            ):
+            if self.autocomplete and not autocomplete_tried:
+                autocomplete_tried = True
                 names = await autocomplete(
                     session, input_value, limit=self.autocomplete_limit
                 )
-                for name in names:
-                    input_identifiers_queue.put(name)
+                pending.extend(names)
 
         return output_identifiers
 
+    async def resolve_compounds(
+        self,
+        session: ClientSession,
+        input_identifiers: List[CompoundIdentifier],
+        output_identifier_types: List[CompoundIdentifierType],
+    ) -> List[List[CompoundIdentifier]]:
+        """Resolve several compounds, looking up PubChem CIDs in batches.
+
+        PubChem only maps results back to the query for CIDs, so other identifier
+        types are resolved one at a time.
+
+        """
+        results = [None] * len(input_identifiers)
+        cids = {}
+        for i, input_identifier in enumerate(input_identifiers):
+            if input_identifier.identifier_type == CompoundIdentifierType.PUBCHEM_CID:
+                cids.setdefault(str(input_identifier.value), []).append(i)
+        if cids:
+            representations, operation = self._get_properties_operation(
+                output_identifier_types
+            )
+            # CID is always returned, so it can be used to match up the results
+            cid_representation = OUTPUT_IDENTIFIER_MAP[
+                CompoundIdentifierType.PUBCHEM_CID
+            ]
+
+            async def get_batch_properties(batch: List[str]) -> List[dict]:
+                async with self.limit():
+                    return await get_properties(
+                        session,
+                        properties=None,
+                        identifier=batch,
+                        operation=operation,
+                        namespace="cid",
+                    )
+
+            cid_list = list(cids)
+            batches = [
+                cid_list[start : start + self.batch_request_size]
+                for start in range(0, len(cid_list), self.batch_request_size)
+            ]
+            # Send the batches concurrently, up to max_concurrency at a time
+            properties_lists = await asyncio.gather(
+                *[get_batch_properties(batch) for batch in batches]
+            )
+            for cid in cid_list:
+                for i in cids[cid]:
+                    results[i] = []
+            for properties_list in properties_lists:
+                for result in properties_list:
+                    output_identifiers = parse_properties([result], representations)
+                    for i in cids.get(str(result.get(cid_representation)), []):
+                        results[i] += output_identifiers
+
+        # Fall back to one request per compound for everything else
+        others = [i for i, result in enumerate(results) if result is None]
+        resolved = await asyncio.gather(
+            *[
+                self.resolve_compound(
+                    session, input_identifiers[i], output_identifier_types
+                )
+                for i in others
+            ]
+        )
+        for i, output_identifiers in zip(others, resolved):
+            results[i] = output_identifiers
+        return results
+
+
+def get_representations(
+    output_identifier_types: List[CompoundIdentifierType],
+) -> Tuple[List[str], List[str]]:
+    """Get the PubChem representations and the properties that have to be requested for them"""
+    representations = list(
+        {
+            OUTPUT_IDENTIFIER_MAP[output_identifier_type]
+            for output_identifier_type in output_identifier_types
+            if output_identifier_type in OUTPUT_IDENTIFIER_MAP
+        }
+    )
+    if not any(representations):
+        raise ValueError(
+            f"{output_identifier_types} contains invalid identifier types for PubChem."
+        )
+    if PROPERTY_EXCEPTIONS:
+        properties = [
+            representation
+            for representation in representations
+            if representation not in PROPERTY_EXCEPTIONS
+        ]
+    else:
+        properties = representations
+    return representations, properties
+
+
+def parse_properties(
+    results: List[dict], representations: List[str]
+) -> List[CompoundIdentifier]:
+    """Convert rows of a PubChem property table to compound identifiers"""
+    output_identifiers = []
+    for representation in representations:
+        for result in results:
+            if result and result.get(representation):
+                output_identifiers += [
+                    CompoundIdentifier(
+                        identifier_type=INVERSE_OUTPUT_IDENTIFIER_MAP[representation],
+                        value=str(result[representation]),
+                    )
+                ]
+    return output_identifiers
+
+
+def properties_operation(properties) -> str:
+    """Build the PUG REST operation that requests some properties"""
+    if isinstance(properties, text_types):
+        properties = properties.split(",")
+    # properties += ",Title"
+    return "property/" + ",".join(PROPERTY_MAP.get(p, p) for p in properties)
+
 
 async def get_properties(
     session: ClientSession,
@@ -198,6 +351,7 @@ async def get_properties(
     identifier,
     namespace="cid",
     searchtype=None,
+    operation=None,
     **kwargs,
 ):
     """Retrieve the specified properties from PubChem.
@@ -205,14 +359,11 @@ async def get_properties(
     :param identifier: The compound, substance or assay identifier to use as a search query.
     :param namespace: (optional) The identifier type.
     :param searchtype: (optional) The advanced search type, one of substructure, superstructure or similarity.
+    :param operation: (optional) A prebuilt properties operation from :func:`properties_operation`, used instead of properties.
     :param as_dataframe: (optional) Automatically extract the properties into a pandas :class:`~pandas.DataFrame`.
     """
-    if isinstance(properties, text_types):
-        properties = properties.split(",")
-    properties = ",".join([PROPERTY_MAP.get(p, p) for p in properties])
-    properties = "property/%s" % properties
-    # properties += ",Title"
-    # print(properties)
+    if operation is None:
+        operation = properties_operation(properties)
     try:
         results = await request(
             session=session,
@@ -220,14 +371,15 @@ async def get_properties(
             identifier=identifier,
             namespace=namespace,
             domain="compound",
-            operation=properties,
+            operation=operation,
             output="JSON",
             searchtype=searchtype,
             **kwargs,
         )
-    except HTTPNotFound:
-        return []
-    print(results)
+    except ClientResponseError as e:
+        if e.status == 404:
+            return []
+        raise
     if results is not None:
         logger.debug(results)
         return results["PropertyTable"]["Properties"]
@@ -254,8 +406,10 @@ async def autocomplete(
             searchtype=None,
             **kwargs,
         )
-    except HTTPNotFound:
-        return []
+    except ClientResponseError as e:
+        if e.status == 404:
+            return []
+        raise
 
     if results.get("dictionary_terms"):
         logger.debug(results)
@@ -303,33 +457,26 @@ async def request(
     else:
         # postdata = urlencode([(namespace, identifier)]).encode("utf8")
         postdata = {namespace: identifier}
-    comps = filter(
-        None, [api_base, domain, searchtype, namespace, urlid, operation, output]
-    )
-    apiurl = "/".join(comps)
+    if domain and namespace and operation and output and not (searchtype or urlid):
+        # Common case (e.g., property lookups) where every component is present
+        apiurl = f"{api_base}/{domain}/{namespace}/{operation}/{output}"
+    else:
+        comps = filter(
+            None, [api_base, domain, searchtype, namespace, urlid, operation, output]
+        )
+        apiurl = "/".join(comps)
     if kwargs:
         apiurl += "?%s" % urlencode(kwargs)
-    # print(apiurl)
-    # print(postdata)
     # Make request
     logger.debug("Request URL: %s", apiurl)
     logger.debug("Request data: %s", postdata)
     async with session.post(apiurl, data=postdata) as resp:
-        response = await resp.json()
-    if response.get("Fault"):
-        code = response["Fault"]["Code"]
-        if code == "PUGREST.BadRequest":
-            raise HTTPBadRequest(reason=code)
-        elif code == "PUGREST.NotFound":
-            raise HTTPNotFound(reason=code)
-        elif code == "PUGREST.NotAllowed":
-            raise HTTPMethodNotAllowed(reason=code)
-        elif code == "PUGREST.Timeout":
-            raise HTTPGatewayTimeout(reason=code)
-        elif code == "PUGREST.ServerBusy":
-            raise HTTPServiceUnavailable(reason=code)
-        elif code == "PUGREST.Unimplemented":
-            raise HTTPNotImplemented(reason=code)
-        elif code == "PUGREST.ServerError" or code == "PUGREST.Unknown":
-            raise HTTPInternalServerError()
+        response = await resp.json(loads=json_loads)
+        if response.get("Fault"):
+            code = response["Fault"]["Code"]
+            status = FAULT_STATUS_MAP.get(code)
+            if status is not None:
+                raise ClientResponseError(
+                    resp.request_info, resp.history, status=status, message=code
+                )
     return response
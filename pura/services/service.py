@@ -1,12 +1,30 @@
 from pura.compound import CompoundIdentifier, CompoundIdentifierType
 from aiohttp import ClientSession
 from abc import ABC, abstractmethod
-from typing import List, Union
+from contextlib import asynccontextmanager
+from typing import List, Optional, Union
+import asyncio
 
 
 class Service(ABC):
-    def __init__(self) -> None:
+    """Base class for services that resolve compound identifiers.
+
+    Parameters
+    ----------
+    max_concurrency : int, optional
+        The maximum number of requests that can be in flight to this
+        service at once. Default is None, which means no limit.
+
+    """
+
+    #: Identifier types that :meth:`resolve_compounds` can look up in batches
+    batch_identifier_types: List[CompoundIdentifierType] = []
+
+    def __init__(self, max_concurrency: Optional[int] = None) -> None:
         self.n_failures = 0
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._semaphore_loop = None
 
     async def setup(self):
         pass
@@ -23,5 +41,47 @@ class Service(ABC):
     ) -> List[Union[CompoundIdentifier, None]]:
         pass
 
+    async def resolve_compounds(
+        self,
+        session: ClientSession,
+        input_identifiers: List[CompoundIdentifier],
+        output_identifier_types: List[CompoundIdentifierType],
+    ) -> List[List[CompoundIdentifier]]:
+        """Resolve several compounds at once.
+
+        By default, each compound is resolved separately. Services that accept
+        multiple identifiers per request override this to batch requests.
+
+        """
+        return await asyncio.gather(
+            *[
+                self.resolve_compound(
+                    session,
+                    input_identifier=input_identifier,
+                    output_identifier_types=output_identifier_types,
+                )
+                for input_identifier in input_identifiers
+            ]
+        )
+
+    @property
+    def cache_key(self) -> str:
+        """Name under which results from this service are cached"""
+        return type(self).__name__
+
+    @asynccontextmanager
+    async def limit(self):
+        """Wait until a request can be made to this service without exceeding max_concurrency"""
+        if self.max_concurrency is None:
+            yield
+            return
+        # Semaphores are bound to an event loop, so create a new one for each loop
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        async with self._semaphore:
+            yield
+
     def reset(self):
         self.n_failures = 0
@@ -1,51 +1,64 @@
 import pint
-from pydantic import BaseModel,GetJsonSchemaHandler
-from pydantic_core import CoreSchema
+from pydantic import BaseModel, GetCoreSchemaHandler, GetJsonSchemaHandler
+from pydantic_core import CoreSchema, core_schema
 from typing import Any, Dict
+from functools import lru_cache
 
 ureg = pint.UnitRegistry()
 
 
+@lru_cache(maxsize=None)
 def quantity(dimensionality: str) -> type:
-    """A method for making a pydantic compliant Pint quantity field type."""
+    """A method for making a pydantic compliant Pint quantity field type.
+
+    Types are cached, so calling this again with the same dimensionality
+    returns the same type.
+
+    """
 
     try:
-        ureg.get_dimensionality(dimensionality)
+        parsed_dimensionality = ureg.get_dimensionality(dimensionality)
     except KeyError:
         raise ValueError(f"{dimensionality} is not a valid dimensionality in pint!")
 
     @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
+    def __get_pydantic_core_schema__(
+        cls, source_type: Any, handler: GetCoreSchemaHandler
+    ) -> CoreSchema:
+        return core_schema.no_info_after_validator_function(
+            cls.validate,
+            core_schema.any_schema(),
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                str, when_used="json"
+            ),
+        )
 
     @classmethod
     def validate(cls, value):
         quantity = pint.Quantity(value)
-        if not quantity.check(cls.dimensionality):
+        if quantity.dimensionality != cls._pura_dimensionality:
             raise ValueError(
                 f"Dimensionality must be {cls.dimensionality}. Currently {quantity.dimensionality}."
             )
         return quantity
-    
+
     @classmethod
     def __get_pydantic_json_schema__(
         cls, core_schema: CoreSchema, handler: GetJsonSchemaHandler
     ) -> Dict[str, Any]:
-        json_schema = super(pint.Quantity, cls).__get_pydantic_json_schema__(core_schema, handler)
+        json_schema = handler(core_schema)
         json_schema = handler.resolve_ref_schema(json_schema)
-        json_schema.update({"$ref": f"#/definitions/Quantity{dimensionality}"})
+        json_schema.update({"type": "string", "title": f"Quantity{dimensionality}"})
         return json_schema
-    # @classmethod
-    # def __modify_schema__(cls, field_schema):
-    #     field_schema.update({"$ref": f"#/definitions/Quantity{dimensionality}"})
 
     return type(
         "Quantity",
         (pint.Quantity,),
         dict(
-            __get_validators__=__get_validators__,
+            __get_pydantic_core_schema__=__get_pydantic_core_schema__,
             __get_pydantic_json_schema__=__get_pydantic_json_schema__,
             dimensionality=dimensionality,
+            _pura_dimensionality=parsed_dimensionality,
             validate=validate,
         ),
     )
@@ -0,0 +1,42 @@
+from pura.compound import Compound, CompoundIdentifier, CompoundIdentifierType
+from pura.reaction import Reaction
+from pydantic import ValidationError
+import pytest
+
+
+def test_compound_round_trip():
+    compound = Compound(
+        identifiers=[
+            CompoundIdentifier(
+                identifier_type=CompoundIdentifierType.SMILES, value="O"
+            ),
+            {"identifier_type": "NAME", "value": "water", "details": "common name"},
+        ]
+    )
+    assert compound.identifiers[1] == CompoundIdentifier(
+        identifier_type=CompoundIdentifierType.NAME, value="water"
+    )
+    assert compound.identifiers[1].details == "common name"
+    assert Compound.model_validate(compound.model_dump()) == compound
+    assert Compound.model_validate_json(compound.model_dump_json()) == compound
+
+    schema = Compound.model_json_schema()
+    identifier_schema = schema["properties"]["identifiers"]["items"]
+    assert identifier_schema["required"] == ["identifier_type", "value"]
+    assert identifier_schema["properties"]["value"]["type"] == "string"
+    Reaction.model_json_schema()
+
+
+@pytest.mark.parametrize(
+    "identifier",
+    [
+        {"identifier_type": "SMILES", "value": "O", "extra": 1},
+        {"identifier_type": "SMILES"},
+        {"identifier_type": "SMILES", "value": 5},
+        {"identifier_type": "NOT_A_TYPE", "value": "O"},
+        "O",
+    ],
+)
+def test_compound_identifier_validation(identifier):
+    with pytest.raises(ValidationError):
+        Compound(identifiers=[identifier])
@@ -1,14 +1,21 @@
 import asyncio
 import pytest
-from pura.resolvers import resolve_identifiers, CompoundResolver
+from pura.resolvers import (
+    resolve_identifiers,
+    CompoundResolver,
+    CircuitBreaker,
+    ResolverError,
+    base_check_agreement,
+)
+from pura.cache import ResolverCache
 from pura.compound import Compound, CompoundIdentifier, CompoundIdentifierType
-from pura.services import CIR, Opsin, ChemSpider, CAS, Service
+from pura.services import CIR, Opsin, ChemSpider, CAS, LocalDatabase, Service
 from pura.services.pubchem import PubChem, OUTPUT_IDENTIFIER_MAP, autocomplete
 from rdkit import Chem
 from aiohttp import *
 from dotenv import load_dotenv
 import logging
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
 
 load_dotenv()
@@ -73,6 +80,501 @@ def test_compound_resolver_service_failure(mock_working_service, mock_failing_se
     assert mock_working_service.resolve_compound.call_count == len(compounds)
 
 
+def test_compound_resolver_http_errors(mock_working_service):
+    # Client errors are not retried, so the next service is used straight away
+    mock_bad_request_service = AsyncMock(spec=Service)
+    mock_bad_request_service.n_failures = 0
+    mock_bad_request_service.resolve_compound.side_effect = ClientResponseError(
+        MagicMock(), (), status=400, message="PUGREST.BadRequest"
+    )
+    resolver = CompoundResolver(
+        services=[mock_bad_request_service, mock_working_service], silent=True
+    )
+    results = resolver.resolve(
+        [
+            Compound(
+                identifiers=[
+                    CompoundIdentifier(
+                        identifier_type=CompoundIdentifierType.NAME, value="water"
+                    )
+                ]
+            )
+        ],
+        output_identifier_type=CompoundIdentifierType.SMILES,
+        n_retries=3,
+    )
+    assert mock_bad_request_service.resolve_compound.call_count == 1
+    assert results[0][1][0].value == "O"
+
+
+def test_compound_resolver_cache(mock_working_service):
+    compounds = [
+        Compound(
+            identifiers=[
+                CompoundIdentifier(
+                    identifier_type=CompoundIdentifierType.NAME, value=name
+                )
+            ]
+        )
+        for name in example_names + example_names
+    ]
+
+    # Duplicate compounds should only be sent to the service once
+    resolver = CompoundResolver(services=[mock_working_service])
+    results = resolver.resolve(
+        compounds,
+        output_identifier_type=CompoundIdentifierType.SMILES,
+        agreement=1,
+    )
+    assert mock_working_service.resolve_compound.call_count == len(example_names)
+    assert len(results) == len(compounds)
+    for (input_compound, resolved), compound in zip(results, compounds):
+        assert input_compound == compound
+        assert resolved[0].value == "O"
+
+    # Repeated calls should be answered from the cache
+    resolver.resolve(
+        compounds,
+        output_identifier_type=CompoundIdentifierType.SMILES,
+        agreement=1,
+    )
+    assert mock_working_service.resolve_compound.call_count == len(example_names)
+
+
+def test_resolver_cache_persistence(tmp_path):
+    path = str(tmp_path / "cache.db")
+    key = ResolverCache.make_key(
+        "PubChem",
+        CompoundIdentifier(identifier_type=CompoundIdentifierType.NAME, value="water"),
+        [CompoundIdentifierType.SMILES],
+    )
+    cache = ResolverCache(path=path, commit_interval=2)
+    assert cache.get(key) is None
+    cache.set(
+        key,
+        [CompoundIdentifier(identifier_type=CompoundIdentifierType.SMILES, value="O")],
+    )
+    # Writes are committed in batches, so other connections do not see them yet
+    other_cache = ResolverCache(path=path)
+    assert other_cache.get(key) is None
+    other_cache.close()
+    cache.close()
+
+    cache = ResolverCache(path=path)
+    assert cache.get(key) == [
+        CompoundIdentifier(identifier_type=CompoundIdentifierType.SMILES, value="O")
+    ]
+    cache.close()
+
+
+def test_compound_resolver_cache_service_config():
+    # Differently configured services must not share cached results
+    cache = ResolverCache()
+    compound = Compound(
+        identifiers=[
+            CompoundIdentifier(identifier_type=CompoundIdentifierType.NAME, value="X")
+        ]
+    )
+    for specify_input_identifier_type, smiles in [(False, "O"), (True, "C")]:
+        service = CIR(specify_input_identifier_type=specify_input_identifier_type)
+        with patch.object(
+            service,
+            "resolve_compound",
+            AsyncMock(
+                return_value=[
+                    CompoundIdentifier(
+                        identifier_type=CompoundIdentifierType.SMILES, value=smiles
+                    )
+                ]
+            ),
+        ) as mock_resolve_compound:
+            results = CompoundResolver(services=[service], cache=cache).resolve(
+                [compound], output_identifier_type=CompoundIdentifierType.SMILES
+            )
+        assert mock_resolve_compound.call_count == 1
+        assert results[0][1][0].value == smiles
+
+    cache_keys = {
+        LocalDatabase().cache_key,
+        LocalDatabase(return_canonical_only=False).cache_key,
+        LocalDatabase(db_path="other.db").cache_key,
+    }
+    assert len(cache_keys) == 3
+
+
+def test_compound_resolver_iter_resolve(mock_working_service):
+    compounds = [
+        Compound(
+            identifiers=[
+                CompoundIdentifier(
+                    identifier_type=CompoundIdentifierType.NAME, value=name
+                )
+            ]
+        )
+        for name in example_names + example_names[:1]
+    ]
+    resolver = CompoundResolver(services=[mock_working_service])
+
+    async def collect():
+        return [
+            result
+            async for result in resolver.iter_resolve(
+                compounds,
+                output_identifier_type=CompoundIdentifierType.SMILES,
+                batch_size=2,
+            )
+        ]
+
+    results = asyncio.run(collect())
+    assert len(results) == len(compounds)
+    assert sorted(
+        input_compound.identifiers[0].value for input_compound, _ in results
+    ) == sorted(example_names + example_names[:1])
+    assert all(resolved[0].value == "O" for _, resolved in results)
+    assert mock_working_service.resolve_compound.call_count == len(example_names)
+
+
+def test_compound_resolver_iter_resolve_early_close(mock_working_service):
+    compounds = [
+        Compound(
+            identifiers=[
+                CompoundIdentifier(
+                    identifier_type=CompoundIdentifierType.NAME, value=name
+                )
+            ]
+        )
+        for name in example_names
+    ]
+    resolver = CompoundResolver(services=[mock_working_service])
+
+    async def take_first():
+        results = resolver.iter_resolve(
+            compounds,
+            output_identifier_type=CompoundIdentifierType.SMILES,
+            batch_size=2,
+        )
+        async for result in results:
+            break
+        await results.aclose()
+        # Services are torn down as soon as the iterator is closed
+        assert mock_working_service.teardown.call_count == 1
+        return result
+
+    with patch("pura.resolvers.tqdm") as mock_tqdm:
+        result = asyncio.run(take_first())
+    # The progress bar is closed too
+    assert mock_tqdm.return_value.close.call_count == 1
+    assert result[1][0].value == "O"
+    assert mock_working_service.resolve_compound.call_count < len(compounds)
+
+
+def test_resolve_identifiers_duplicates(mock_working_service):
+    names = ["water", "THF", "water", "DCM", "water"]
+    results = resolve_identifiers(
+        names,
+        output_identifier_type=CompoundIdentifierType.SMILES,
+        services=[mock_working_service],
+    )
+    assert mock_working_service.resolve_compound.call_count == 3
+    assert [name for name, _ in results] == names
+    assert all(values == ["O"] for _, values in results)
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert not breaker.allow_request()
+
+    # After the timeout, one probe is let through and success closes the breaker
+    breaker.reset_timeout = 0
+    assert breaker.allow_request()
+    breaker.record_success()
+    breaker.reset_timeout = 60
+    assert breaker.allow_request()
+
+
+def test_compound_resolver_circuit_breaker(caplog):
+    compounds = [
+        Compound(
+            identifiers=[
+                CompoundIdentifier(
+                    identifier_type=CompoundIdentifierType.NAME, value=name
+                )
+            ]
+        )
+        for name in example_names
+    ]
+    water = [
+        CompoundIdentifier(identifier_type=CompoundIdentifierType.SMILES, value="O")
+    ]
+    server_error = ClientResponseError(
+        MagicMock(), (), status=500, message="PUGREST.ServerError"
+    )
+    mock_service = AsyncMock(spec=Service)
+    mock_service.n_failures = 0
+    mock_service.resolve_compound.side_effect = [server_error] * 3 + [water] * 2
+    resolver = CompoundResolver(
+        services=[mock_service],
+        silent=True,
+        cache=False,
+        failure_threshold=3,
+        reset_timeout=60,
+    )
+
+    # The breaker opens after 3 failures, so the other compounds are skipped
+    with caplog.at_level(logging.WARNING, logger="pura.resolvers"):
+        results = resolver.resolve(
+            compounds,
+            output_identifier_type=CompoundIdentifierType.SMILES,
+            batch_size=1,
+        )
+    assert mock_service.resolve_compound.call_count == 3
+    assert all(resolved == [] for _, resolved in results)
+    assert f"skipped for {example_names[-1]}" in caplog.text
+    circuit_breaker = resolver._circuit_breakers[mock_service]
+    assert circuit_breaker.opened_at is not None
+
+    # Skipped compounds are errors rather than missing results when not silent
+    resolver.silent = False
+    with pytest.raises(ResolverError):
+        resolver.resolve(
+            compounds[:1], output_identifier_type=CompoundIdentifierType.SMILES
+        )
+    resolver.silent = True
+
+    # After the timeout, a successful probe closes the breaker again
+    circuit_breaker.opened_at -= 60
+    results = resolver.resolve(
+        compounds[:2], output_identifier_type=CompoundIdentifierType.SMILES
+    )
+    assert mock_service.resolve_compound.call_count == 5
+    assert all(resolved[0].value == "O" for _, resolved in results)
+    assert circuit_breaker.opened_at is None
+
+
+@pytest.mark.parametrize(
+    "values_list,agreement,expected",
+    [
+        ([["O", "C"], ["O"], []], 2, ["O"]),
+        ([["O"], ["C"], ["N"]], 2, None),
+        ([["O", "C"], ["C", "O"], ["C"]], 3, ["C"]),
+        ([["O", "C"], ["C", "O"]], 2, ["O", "C"]),
+    ],
+)
+def test_base_check_agreement(values_list, agreement, expected):
+    identifiers_list = [
+        [
+            CompoundIdentifier(identifier_type=CompoundIdentifierType.SMILES, value=v)
+            for v in values
+        ]
+        for values in values_list
+    ]
+    agreed, satisfied = base_check_agreement(identifiers_list, agreement, None)
+    if expected is None:
+        assert not satisfied
+        assert agreed == identifiers_list
+    else:
+        assert satisfied
+        assert [identifier.value for identifier in agreed[0]] == expected
+
+
+def test_pubchem_resolve_compounds_batches_cids():
+    cids = ["2244", "3672", "2244"]
+    response = {
+        "PropertyTable": {
+            "Properties": [
+                {"CID": 2244, "CanonicalSMILES": "CC(=O)OC1=CC=CC=C1C(=O)O"},
+                {"CID": 3672, "CanonicalSMILES": "CC(C)CC1=CC=C(C=C1)C(C)C(=O)O"},
+            ]
+        }
+    }
+    service = PubChem()
+    with patch(
+        "pura.services.pubchem.request", AsyncMock(return_value=response)
+    ) as mock_request:
+        resolved = asyncio.run(
+            service.resolve_compounds(
+                None,
+                input_identifiers=[
+                    CompoundIdentifier(
+                        identifier_type=CompoundIdentifierType.PUBCHEM_CID, value=cid
+                    )
+                    for cid in cids
+                ],
+                output_identifier_types=[CompoundIdentifierType.SMILES],
+            )
+        )
+    assert mock_request.call_count == 1
+    assert [identifiers[0].value for identifiers in resolved] == [
+        "CC(=O)OC1=CC=CC=C1C(=O)O",
+        "CC(C)CC1=CC=C(C=C1)C(C)C(=O)O",
+        "CC(=O)OC1=CC=CC=C1C(=O)O",
+    ]
+
+
+def test_compound_resolver_prefetch_errors(mock_working_service):
+    # PubChem cannot resolve to CAS numbers, so the next service should be used
+    compound = Compound(
+        identifiers=[
+            CompoundIdentifier(
+                identifier_type=CompoundIdentifierType.PUBCHEM_CID, value="962"
+            )
+        ]
+    )
+    resolver = CompoundResolver(
+        services=[PubChem(), mock_working_service], silent=True, cache=False
+    )
+    results = resolver.resolve(
+        [compound], output_identifier_type=CompoundIdentifierType.CAS_NUMBER
+    )
+    assert mock_working_service.resolve_compound.call_count == 1
+    assert results[0][1][0].value == "O"
+
+
+def test_compound_resolver_prefetch_without_cache():
+    # Batch requests should still be used when caching is disabled
+    compounds = [
+        Compound(
+            identifiers=[
+                CompoundIdentifier(
+                    identifier_type=CompoundIdentifierType.PUBCHEM_CID, value=cid
+                )
+            ]
+        )
+        for cid in ["2244", "3672"]
+    ]
+    response = {
+        "PropertyTable": {
+            "Properties": [
+                {"CID": 2244, "CanonicalSMILES": "CC(=O)OC1=CC=CC=C1C(=O)O"},
+                {"CID": 3672, "CanonicalSMILES": "CC(C)CC1=CC=C(C=C1)C(C)C(=O)O"},
+            ]
+        }
+    }
+    resolver = CompoundResolver(services=[PubChem()], cache=False)
+    with patch(
+        "pura.services.pubchem.request", AsyncMock(return_value=response)
+    ) as mock_request:
+        results = resolver.resolve(
+            compounds, output_identifier_type=CompoundIdentifierType.SMILES
+        )
+    assert mock_request.call_count == 1
+    assert [len(resolved) for _, resolved in results] == [1, 1]
+
+
+def test_compound_resolver_prefetch_retries():
+    compounds = [
+        Compound(
+            identifiers=[
+                CompoundIdentifier(
+                    identifier_type=CompoundIdentifierType.PUBCHEM_CID, value=cid
+                )
+            ]
+        )
+        for cid in ["2244", "3672"]
+    ]
+    response = {
+        "PropertyTable": {
+            "Properties": [
+                {"CID": 2244, "CanonicalSMILES": "CC(=O)OC1=CC=CC=C1C(=O)O"},
+                {"CID": 3672, "CanonicalSMILES": "CC(C)CC1=CC=C(C=C1)C(C)C(=O)O"},
+            ]
+        }
+    }
+    server_busy = ClientResponseError(
+        MagicMock(), (), status=503, message="PUGREST.ServerBusy"
+    )
+    bad_request = ClientResponseError(
+        MagicMock(), (), status=400, message="PUGREST.BadRequest"
+    )
+
+    # A busy server is retried with the whole batch
+    service = PubChem()
+    resolver = CompoundResolver(services=[service])
+    with patch(
+        "pura.services.pubchem.request",
+        AsyncMock(side_effect=[server_busy, response]),
+    ) as mock_request, patch("pura.resolvers.asyncio.sleep", AsyncMock()):
+        results = resolver.resolve(
+            compounds, output_identifier_type=CompoundIdentifierType.SMILES
+        )
+    assert mock_request.call_count == 2
+    assert [len(resolved) for _, resolved in results] == [1, 1]
+    assert resolver._circuit_breakers[service].n_failures == 0
+
+    # A bad request is not retried and does not count as a service failure
+    service = PubChem()
+    resolver = CompoundResolver(services=[service], silent=True)
+    with patch(
+        "pura.services.pubchem.request", AsyncMock(side_effect=bad_request)
+    ) as mock_request:
+        resolver.resolve(
+            compounds, output_identifier_type=CompoundIdentifierType.SMILES
+        )
+    # One batch request, then one request per compound
+    assert mock_request.call_count == 1 + len(compounds)
+    assert resolver._circuit_breakers[service].n_failures == 0
+
+
+def test_pubchem_resolve_compounds_concurrent_batches():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def get_properties(session, identifier, **kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return [{"CID": int(cid), "CanonicalSMILES": "O"} for cid in identifier]
+
+    service = PubChem(max_concurrency=2, batch_request_size=1)
+    with patch("pura.services.pubchem.get_properties", get_properties):
+        resolved = asyncio.run(
+            service.resolve_compounds(
+                None,
+                input_identifiers=[
+                    CompoundIdentifier(
+                        identifier_type=CompoundIdentifierType.PUBCHEM_CID,
+                        value=str(cid),
+                    )
+                    for cid in range(5)
+                ],
+                output_identifier_types=[CompoundIdentifierType.SMILES],
+            )
+        )
+    assert max_in_flight == 2
+    assert all(identifiers[0].value == "O" for identifiers in resolved)
+
+
+def test_pubchem_autocomplete_fallback():
+    service = PubChem(autocomplete=True, autocomplete_limit=2)
+    with patch(
+        "pura.services.pubchem.get_properties",
+        AsyncMock(side_effect=[[], [{"CID": 962, "CanonicalSMILES": "O"}], []]),
+    ) as mock_get_properties, patch(
+        "pura.services.pubchem.autocomplete",
+        AsyncMock(return_value=["water", "dihydrogen oxide"]),
+    ) as mock_autocomplete:
+        resolved = asyncio.run(
+            service.resolve_compound(
+                None,
+                input_identifier=CompoundIdentifier(
+                    identifier_type=CompoundIdentifierType.NAME, value="watr"
+                ),
+                output_identifier_types=[CompoundIdentifierType.SMILES],
+            )
+        )
+    # Stop at the first autocomplete suggestion that resolves
+    assert mock_autocomplete.call_count == 1
+    assert mock_get_properties.call_count == 2
+    assert resolved == [
+        CompoundIdentifier(identifier_type=CompoundIdentifierType.SMILES, value="O")
+    ]
+
+
 # @pytest.mark.parametrize("identifier_type", OUTPUT_IDENTIFIER_MAP)
 # def test_resolve_identifiers_no_agreement(identifier_type):
 #     resolved = resolve_identifiers(